@@ -3,20 +3,28 @@
 Document Converter API - REST API for converting HTML/Markdown to PDF
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import tempfile
 import os
 from pathlib import Path
 import uuid
-from typing import Optional
+from typing import List, Optional
+from pydantic import BaseModel
 import markdown2
 from weasyprint import HTML, CSS
 from PIL import Image
 import io
 import zipfile
 import shutil
+import json
+import re
+from profiling import ProfilingMiddleware, profile_phase, profiled_call, token_matches
+from compression import CompressionMiddleware, read_body
+from images import downsample_images
+from compose import compose_pdf
 
 app = FastAPI(
     title="Document Converter API",
@@ -33,26 +41,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress PDF and other compressible responses when the client accepts it
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
 # Directory for temporary files
 TEMP_DIR = tempfile.gettempdir()
 CSS_PATH = os.path.join(os.path.dirname(__file__), 'style.css')
 
+# Profiling configuration. Profiling is disabled unless ADMIN_TOKEN is set.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(TEMP_DIR, 'document-converter-profiles'))
+# Renders slower than PROFILE_SLOW_MS are kept from a PROFILE_SAMPLE_RATE share
+# of requests (0 disables the automatic capture)
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '0'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0.05'))
+# Oldest profiles beyond this count are deleted when a new one is saved
+PROFILE_MAX_COUNT = int(os.environ.get('PROFILE_MAX_COUNT', '100'))
+
+# Resolution embedded images are downsampled to (matches the image endpoints)
+DOWNSAMPLE_DPI = int(os.environ.get('DOWNSAMPLE_DPI', '150'))
+
+# Largest raw request body accepted, measured after decompression
+MAX_BODY_BYTES = int(os.environ.get('MAX_BODY_BYTES', str(50 * 1024 * 1024)))
+
+# Raw-body Content-Types and whether they hold Markdown
+RAW_CONTENT_TYPES = {
+    'text/markdown': True,
+    'text/x-markdown': True,
+    'text/html': False,
+}
+
+
+# Profile /convert/* requests on admin demand or when sampled as slow
+app.add_middleware(
+    ProfilingMiddleware,
+    admin_token=ADMIN_TOKEN,
+    directory=PROFILE_DIR,
+    slow_ms=PROFILE_SLOW_MS,
+    sample_rate=PROFILE_SAMPLE_RATE,
+    max_count=PROFILE_MAX_COUNT
+)
+
+
+def is_admin(request: Request) -> bool:
+    """Check the request's X-Admin-Token header against ADMIN_TOKEN."""
+    return token_matches(request.headers.get('x-admin-token', ''), ADMIN_TOKEN)
+
+
+async def run_conversion(func, *args):
+    """Run a blocking conversion step in a worker thread, sampled by any active profiler."""
+    return await run_in_threadpool(profiled_call, func, *args)
+
 
 def markdown_to_html(markdown_content: str) -> str:
     """Convert Markdown content to HTML."""
-    html = markdown2.markdown(
-        markdown_content,
-        extras=[
-            'fenced-code-blocks',
-            'tables',
-            'break-on-newline',
-            'header-ids',
-            'code-friendly',
-            'footnotes',
-            'strike',
-            'task_list'
-        ]
-    )
+    with profile_phase('markdown_to_html'):
+        html = markdown2.markdown(
+            markdown_content,
+            extras=[
+                'fenced-code-blocks',
+                'tables',
+                'break-on-newline',
+                'header-ids',
+                'code-friendly',
+                'footnotes',
+                'strike',
+                'task_list'
+            ]
+        )
     return f"""<!DOCTYPE html>
 <html lang="en">
 <head>
@@ -66,12 +122,11 @@ def markdown_to_html(markdown_content: str) -> str:
 </html>"""
 
 
-def html_to_pdf(html_content: str, output_path: str, custom_css: Optional[str] = None) -> bool:
-    """Convert HTML content to PDF with Google Docs styling."""
-    try:
-        # Ensure complete HTML document
-        if '<html' not in html_content.lower():
-            html_content = f"""<!DOCTYPE html>
+def ensure_html_document(html_content: str) -> str:
+    """Wrap an HTML fragment in a complete document template."""
+    if '<html' in html_content.lower():
+        return html_content
+    return f"""<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -82,6 +137,20 @@ def html_to_pdf(html_content: str, output_path: str, custom_css: Optional[str] =
     {html_content}
 </body>
 </html>"""
+
+
+def html_to_pdf(html_content: str, output_path: str, custom_css: Optional[str] = None,
+                print_quality: bool = False) -> bool:
+    """Convert HTML content to PDF with Google Docs styling."""
+    try:
+        # Ensure complete HTML document
+        html_content = ensure_html_document(html_content)
+        
+        # Shrink oversized images to their rendered size before layout. The
+        # bound assumes style.css's letter page, so custom CSS skips this step.
+        if not print_quality and not custom_css:
+            with profile_phase('image_downsampling'):
+                html_content = downsample_images(html_content, DOWNSAMPLE_DPI)
         
         # Prepare stylesheets
         stylesheets = []
@@ -94,9 +163,11 @@ def html_to_pdf(html_content: str, output_path: str, custom_css: Optional[str] =
         elif os.path.exists(CSS_PATH):
             stylesheets.append(CSS(filename=CSS_PATH))
         
-        # Generate PDF
-        html_obj = HTML(string=html_content)
-        html_obj.write_pdf(output_path, stylesheets=stylesheets)
+        # Generate PDF (render runs the CSS cascade and layout, write_pdf draws)
+        with profile_phase('render'):
+            document = HTML(string=html_content).render(stylesheets=stylesheets)
+        with profile_phase('drawing'):
+            document.write_pdf(output_path)
         
         # Clean up temp CSS if created
         if custom_css:
@@ -112,22 +183,18 @@ def html_to_pdf(html_content: str, output_path: str, custom_css: Optional[str] =
 
 
 def html_to_image(html_content: str, output_path: str, image_format: str = 'png', 
-                  custom_css: Optional[str] = None, width: int = 1200) -> str:
+                  custom_css: Optional[str] = None, width: int = 1200,
+                  print_quality: bool = False) -> str:
     """Convert HTML content to Image (PNG, JPG, etc.). Returns path to output file (could be .zip for multi-page)."""
     try:
         # Ensure complete HTML document
-        if '<html' not in html_content.lower():
-            html_content = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Document</title>
-</head>
-<body>
-    {html_content}
-</body>
-</html>"""
+        html_content = ensure_html_document(html_content)
+        
+        # Shrink oversized images to their rendered size before layout. The
+        # bound assumes style.css's letter page, so custom CSS skips this step.
+        if not print_quality and not custom_css:
+            with profile_phase('image_downsampling'):
+                html_content = downsample_images(html_content, DOWNSAMPLE_DPI)
         
         # Prepare stylesheets
         stylesheets = []
@@ -142,15 +209,18 @@ def html_to_image(html_content: str, output_path: str, image_format: str = 'png'
         
         # Generate PDF first (WeasyPrint can't directly export to image)
         temp_pdf = os.path.join(TEMP_DIR, f"temp_{uuid.uuid4().hex}.pdf")
-        html_obj = HTML(string=html_content)
-        html_obj.write_pdf(temp_pdf, stylesheets=stylesheets)
+        with profile_phase('render'):
+            document = HTML(string=html_content).render(stylesheets=stylesheets)
+        with profile_phase('drawing'):
+            document.write_pdf(temp_pdf)
         
         # Convert PDF to image using pdf2image
         try:
             from pdf2image import convert_from_path
             
             # Convert ALL pages to images
-            images = convert_from_path(temp_pdf, dpi=150)
+            with profile_phase('rasterization'):
+                images = convert_from_path(temp_pdf, dpi=150)
             
             if not images:
                 print("No images generated from PDF")
@@ -244,7 +314,11 @@ async def root():
             "POST /convert/markdown/image": "Convert Markdown content to Image",
             "POST /convert/html/image": "Convert HTML content to Image",
             "POST /convert/file/image": "Upload and convert a file to Image",
-            "GET /health": "Health check endpoint"
+            "POST /convert/raw": "Convert a raw (optionally compressed) Markdown/HTML body to PDF",
+            "POST /convert/raw/image": "Convert a raw (optionally compressed) Markdown/HTML body to Image",
+            "POST /convert/compose": "Compose a PDF from several Markdown/HTML parts",
+            "GET /health": "Health check endpoint",
+            "GET /profiles": "List saved conversion profiles (admin)"
         }
     }
 
@@ -255,11 +329,62 @@ async def health():
     return {"status": "healthy"}
 
 
+# ============================================================================
+# PROFILING ENDPOINTS
+# ============================================================================
+
+def profile_path(profile_id: str, extension: str) -> str:
+    """Return the path of a saved profile file, rejecting malformed IDs."""
+    if not re.fullmatch(r'[0-9a-f]{32}', profile_id):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{extension}")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return path
+
+
+@app.get("/profiles")
+async def list_profiles(request: Request):
+    """List saved conversion profiles, newest first (requires X-Admin-Token)."""
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    
+    summaries = []
+    if os.path.isdir(PROFILE_DIR):
+        for name in os.listdir(PROFILE_DIR):
+            if name.endswith('.json'):
+                with open(os.path.join(PROFILE_DIR, name), 'r', encoding='utf-8') as f:
+                    summaries.append(json.load(f))
+    summaries.sort(key=lambda summary: summary.get('started_at') or 0, reverse=True)
+    return {"profiles": summaries}
+
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    """Return the per-stage summary of a saved profile (requires X-Admin-Token)."""
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    
+    with open(profile_path(profile_id, 'json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@app.get("/profiles/{profile_id}/folded")
+async def get_profile_folded(profile_id: str, request: Request):
+    """Return a saved profile as folded stacks for flame graph tools (requires X-Admin-Token)."""
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    
+    with open(profile_path(profile_id, 'folded'), 'r', encoding='utf-8') as f:
+        return PlainTextResponse(f.read())
+
+
 @app.post("/convert/markdown")
 async def convert_markdown(
     content: str = Form(...),
     filename: Optional[str] = Form("document.pdf"),
-    custom_css: Optional[str] = Form(None)
+    custom_css: Optional[str] = Form(None),
+    print_quality: Optional[bool] = Form(False)
 ):
     """
     Convert Markdown content to PDF.
@@ -267,6 +392,7 @@ async def convert_markdown(
     - **content**: Markdown content as string
     - **filename**: Optional output filename (default: document.pdf)
     - **custom_css**: Optional custom CSS styling
+    - **print_quality**: Keep embedded images at full resolution (default: false)
     """
     try:
         # Generate unique filename
@@ -274,10 +400,10 @@ async def convert_markdown(
         pdf_path = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}_{pdf_filename}")
         
         # Convert Markdown to HTML
-        html_content = markdown_to_html(content)
+        html_content = await run_conversion(markdown_to_html, content)
         
         # Convert to PDF
-        success = html_to_pdf(html_content, pdf_path, custom_css)
+        success = await run_conversion(html_to_pdf, html_content, pdf_path, custom_css, print_quality)
         
         if not success:
             raise HTTPException(status_code=500, detail="Failed to generate PDF")
@@ -297,7 +423,8 @@ async def convert_markdown(
 async def convert_html(
     content: str = Form(...),
     filename: Optional[str] = Form("document.pdf"),
-    custom_css: Optional[str] = Form(None)
+    custom_css: Optional[str] = Form(None),
+    print_quality: Optional[bool] = Form(False)
 ):
     """
     Convert HTML content to PDF.
@@ -305,6 +432,7 @@ async def convert_html(
     - **content**: HTML content as string
     - **filename**: Optional output filename (default: document.pdf)
     - **custom_css**: Optional custom CSS styling
+    - **print_quality**: Keep embedded images at full resolution (default: false)
     """
     try:
         # Generate unique filename
@@ -312,7 +440,7 @@ async def convert_html(
         pdf_path = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}_{pdf_filename}")
         
         # Convert to PDF
-        success = html_to_pdf(content, pdf_path, custom_css)
+        success = await run_conversion(html_to_pdf, content, pdf_path, custom_css, print_quality)
         
         if not success:
             raise HTTPException(status_code=500, detail="Failed to generate PDF")
@@ -331,13 +459,15 @@ async def convert_html(
 @app.post("/convert/file")
 async def convert_file(
     file: UploadFile = File(...),
-    custom_css: Optional[str] = Form(None)
+    custom_css: Optional[str] = Form(None),
+    print_quality: Optional[bool] = Form(False)
 ):
     """
     Upload and convert a file (Markdown or HTML) to PDF.
     
     - **file**: File upload (.md, .markdown, .html, .htm)
     - **custom_css**: Optional custom CSS styling
+    - **print_quality**: Keep embedded images at full resolution (default: false)
     """
     try:
         # Validate file type
@@ -358,12 +488,12 @@ async def convert_file(
         
         # Convert based on file type
         if file_ext in ['.md', '.markdown']:
-            html_content = markdown_to_html(content_str)
+            html_content = await run_conversion(markdown_to_html, content_str)
         else:
             html_content = content_str
         
         # Convert to PDF
-        success = html_to_pdf(html_content, pdf_path, custom_css)
+        success = await run_conversion(html_to_pdf, html_content, pdf_path, custom_css, print_quality)
         
         if not success:
             raise HTTPException(status_code=500, detail="Failed to generate PDF")
@@ -391,7 +521,8 @@ async def convert_markdown_to_image(
     filename: Optional[str] = Form("document.png"),
     image_format: Optional[str] = Form("png"),
     custom_css: Optional[str] = Form(None),
-    width: Optional[int] = Form(1200)
+    width: Optional[int] = Form(1200),
+    print_quality: Optional[bool] = Form(False)
 ):
     """
     Convert Markdown content to Image (PNG, JPG, JPEG).
@@ -401,6 +532,7 @@ async def convert_markdown_to_image(
     - **image_format**: Image format - png, jpg, or jpeg (default: png)
     - **custom_css**: Optional custom CSS styling
     - **width**: Image width in pixels (default: 1200)
+    - **print_quality**: Keep embedded images at full resolution (default: false)
     """
     try:
         # Validate image format
@@ -418,10 +550,10 @@ async def convert_markdown_to_image(
         image_path = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}_{filename}")
         
         # Convert Markdown to HTML
-        html_content = markdown_to_html(content)
+        html_content = await run_conversion(markdown_to_html, content)
         
         # Convert to Image
-        result_path = html_to_image(html_content, image_path, image_format, custom_css, width)
+        result_path = await run_conversion(html_to_image, html_content, image_path, image_format, custom_css, width, print_quality)
         
         if not result_path:
             raise HTTPException(status_code=500, detail="Failed to generate image")
@@ -455,7 +587,8 @@ async def convert_html_to_image(
     filename: Optional[str] = Form("document.png"),
     image_format: Optional[str] = Form("png"),
     custom_css: Optional[str] = Form(None),
-    width: Optional[int] = Form(1200)
+    width: Optional[int] = Form(1200),
+    print_quality: Optional[bool] = Form(False)
 ):
     """
     Convert HTML content to Image (PNG, JPG, JPEG).
@@ -465,6 +598,7 @@ async def convert_html_to_image(
     - **image_format**: Image format - png, jpg, or jpeg (default: png)
     - **custom_css**: Optional custom CSS styling
     - **width**: Image width in pixels (default: 1200)
+    - **print_quality**: Keep embedded images at full resolution (default: false)
     """
     try:
         # Validate image format
@@ -482,7 +616,7 @@ async def convert_html_to_image(
         image_path = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}_{filename}")
         
         # Convert to Image
-        result_path = html_to_image(content, image_path, image_format, custom_css, width)
+        result_path = await run_conversion(html_to_image, content, image_path, image_format, custom_css, width, print_quality)
         
         if not result_path:
             raise HTTPException(status_code=500, detail="Failed to generate image")
@@ -515,7 +649,8 @@ async def convert_file_to_image(
     file: UploadFile = File(...),
     image_format: Optional[str] = Form("png"),
     custom_css: Optional[str] = Form(None),
-    width: Optional[int] = Form(1200)
+    width: Optional[int] = Form(1200),
+    print_quality: Optional[bool] = Form(False)
 ):
     """
     Upload and convert a file (Markdown or HTML) to Image (PNG, JPG, JPEG).
@@ -524,6 +659,7 @@ async def convert_file_to_image(
     - **image_format**: Image format - png, jpg, or jpeg (default: png)
     - **custom_css**: Optional custom CSS styling
     - **width**: Image width in pixels (default: 1200)
+    - **print_quality**: Keep embedded images at full resolution (default: false)
     """
     try:
         # Validate file type
@@ -552,12 +688,12 @@ async def convert_file_to_image(
         
         # Convert based on file type
         if file_ext in ['.md', '.markdown']:
-            html_content = markdown_to_html(content_str)
+            html_content = await run_conversion(markdown_to_html, content_str)
         else:
             html_content = content_str
         
         # Convert to Image
-        result_path = html_to_image(html_content, image_path, image_format, custom_css, width)
+        result_path = await run_conversion(html_to_image, html_content, image_path, image_format, custom_css, width, print_quality)
         
         if not result_path:
             raise HTTPException(status_code=500, detail="Failed to generate image")
@@ -587,6 +723,208 @@ async def convert_file_to_image(
         raise HTTPException(status_code=500, detail=f"Error converting file to image: {str(e)}")
 
 
+# ============================================================================
+# RAW BODY CONVERSION ENDPOINTS
+# ============================================================================
+
+async def read_raw_html(request: Request) -> str:
+    """Read a raw text/markdown or text/html request body and return HTML."""
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type not in RAW_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported Content-Type: {content_type}. Supported: {', '.join(RAW_CONTENT_TYPES)}"
+        )
+    
+    body = await read_body(request, MAX_BODY_BYTES)
+    try:
+        content_str = body.decode('utf-8')
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be UTF-8 encoded text")
+    
+    if RAW_CONTENT_TYPES[content_type]:
+        return await run_conversion(markdown_to_html, content_str)
+    return content_str
+
+
+@app.post("/convert/raw")
+async def convert_raw(
+    request: Request,
+    filename: Optional[str] = "document.pdf",
+    custom_css: Optional[str] = None,
+    print_quality: Optional[bool] = False
+):
+    """
+    Convert a raw Markdown or HTML request body to PDF.
+    
+    The body is sent as `text/markdown` or `text/html` and may be compressed
+    with `Content-Encoding: gzip` or `zstd`.
+    
+    - **filename**: Optional output filename (default: document.pdf)
+    - **custom_css**: Optional custom CSS styling
+    - **print_quality**: Keep embedded images at full resolution (default: false)
+    """
+    html_content = await read_raw_html(request)
+    try:
+        # Generate unique filename
+        pdf_filename = filename if filename.endswith('.pdf') else f"{filename}.pdf"
+        pdf_path = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}_{pdf_filename}")
+        
+        # Convert to PDF
+        success = await run_conversion(html_to_pdf, html_content, pdf_path, custom_css, print_quality)
+        
+        if not success:
+            raise HTTPException(status_code=500, detail="Failed to generate PDF")
+        
+        # Return PDF file
+        return FileResponse(
+            pdf_path,
+            media_type="application/pdf",
+            filename=pdf_filename,
+            background=None
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error converting raw body: {str(e)}")
+
+
+@app.post("/convert/raw/image")
+async def convert_raw_to_image(
+    request: Request,
+    filename: Optional[str] = "document.png",
+    image_format: Optional[str] = "png",
+    custom_css: Optional[str] = None,
+    width: Optional[int] = 1200,
+    print_quality: Optional[bool] = False
+):
+    """
+    Convert a raw Markdown or HTML request body to Image (PNG, JPG, JPEG).
+    
+    The body is sent as `text/markdown` or `text/html` and may be compressed
+    with `Content-Encoding: gzip` or `zstd`.
+    
+    - **filename**: Optional output filename (default: document.png)
+    - **image_format**: Image format - png, jpg, or jpeg (default: png)
+    - **custom_css**: Optional custom CSS styling
+    - **width**: Image width in pixels (default: 1200)
+    - **print_quality**: Keep embedded images at full resolution (default: false)
+    """
+    # Validate image format
+    image_format = image_format.lower()
+    if image_format not in ['png', 'jpg', 'jpeg']:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported image format: {image_format}. Supported: png, jpg, jpeg"
+        )
+    
+    html_content = await read_raw_html(request)
+    try:
+        # Generate unique filename
+        if not filename.endswith(('.png', '.jpg', '.jpeg')):
+            filename = f"{filename}.{image_format}"
+        
+        image_path = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}_{filename}")
+        
+        # Convert to Image
+        result_path = await run_conversion(html_to_image, html_content, image_path, image_format, custom_css, width, print_quality)
+        
+        if not result_path:
+            raise HTTPException(status_code=500, detail="Failed to generate image")
+        
+        # Check if result is a zip file (multi-page)
+        if result_path.endswith('.zip'):
+            media_type = "application/zip"
+            filename = filename.replace(f'.{image_format}', '.zip')
+        else:
+            media_type = "image/png" if image_format == "png" else "image/jpeg"
+        return FileResponse(
+            result_path,
+            media_type=media_type,
+            filename=filename,
+            background=None
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error converting raw body to image: {str(e)}")
+
+
+# ============================================================================
+# COMPOSITION ENDPOINT
+# ============================================================================
+
+class ComposePart(BaseModel):
+    """One part of a composed document."""
+    content: str
+    format: str = "html"
+    static: bool = False
+
+
+class ComposeRequest(BaseModel):
+    """Parts and options for a composed PDF."""
+    parts: List[ComposePart]
+    filename: str = "document.pdf"
+    custom_css: Optional[str] = None
+    print_quality: Optional[bool] = False
+
+
+@app.post("/convert/compose")
+async def convert_compose(compose_request: ComposeRequest):
+    """
+    Compose a PDF from several Markdown or HTML parts.
+    
+    Each part is laid out separately and page numbers continue across parts.
+    Parts marked `static` (e.g. a cover page or appendix) keep their laid-out
+    pages cached, so only the changed parts are rendered on later requests.
+    
+    - **parts**: List of `{content, format, static}` objects; format is html or markdown (default: html)
+    - **filename**: Optional output filename (default: document.pdf)
+    - **custom_css**: Optional custom CSS styling
+    - **print_quality**: Keep embedded images at full resolution (default: false)
+    """
+    if not compose_request.parts:
+        raise HTTPException(status_code=400, detail="At least one part is required")
+    for part in compose_request.parts:
+        if part.format.lower() not in ['html', 'markdown']:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported part format: {part.format}. Supported: html, markdown"
+            )
+    
+    try:
+        # Generate unique filename
+        filename = compose_request.filename
+        pdf_filename = filename if filename.endswith('.pdf') else f"{filename}.pdf"
+        pdf_path = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}_{pdf_filename}")
+        
+        # Convert each part to a complete HTML document
+        parts = []
+        for part in compose_request.parts:
+            if part.format.lower() == 'markdown':
+                html_content = await run_conversion(markdown_to_html, part.content)
+            else:
+                html_content = ensure_html_document(part.content)
+            parts.append((html_content, part.static))
+        
+        # Use custom CSS or the default stylesheet for every part
+        css_text, css_base_url = compose_request.custom_css, None
+        if not css_text and os.path.exists(CSS_PATH):
+            with open(CSS_PATH, 'r', encoding='utf-8') as f:
+                css_text, css_base_url = f.read(), CSS_PATH
+        
+        # Compose the PDF
+        downsample = not compose_request.print_quality and not compose_request.custom_css
+        dpi = DOWNSAMPLE_DPI if downsample else None
+        await run_conversion(compose_pdf, parts, pdf_path, css_text, css_base_url, dpi)
+        
+        # Return PDF file
+        return FileResponse(
+            pdf_path,
+            media_type="application/pdf",
+            filename=pdf_filename,
+            background=None
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error composing PDF: {str(e)}")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
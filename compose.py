@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Document Converter Composition - Assemble one PDF from separately rendered parts
+
+Each part (e.g. a cover page, a dynamic body and an appendix) is laid out on
+its own, and the pages are joined into a single PDF. Static parts keep their
+laid-out pages in an in-memory cache, so only the parts that changed go
+through WeasyPrint layout on each request.
+
+Drawing a laid-out page is not read-only (WeasyPrint reconfigures each text
+box's Pango layout), so every cached part carries a lock that is held while
+its pages are drawn.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack
+from typing import List, Optional, Tuple
+
+from weasyprint import HTML, CSS
+
+from images import downsample_images
+from profiling import profile_phase
+
+
+# Number of laid-out static parts kept in memory, each with its drawing lock
+CACHE_SIZE = 16
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(html_content: str, css_text: Optional[str], start_page: int,
+               dpi: Optional[int]) -> str:
+    digest = hashlib.sha256()
+    for value in (html_content, css_text or '', str(start_page), str(dpi)):
+        digest.update(value.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def render_part(html_content: str, css_text: Optional[str] = None, css_base_url: Optional[str] = None,
+                start_page: int = 1, static: bool = False, dpi: Optional[int] = 150):
+    """
+    Lay out one part and return its WeasyPrint document and drawing lock.
+
+    Pages are numbered from start_page so the `counter(page)` footer continues
+    across parts. Static parts are cached by content, CSS and start page, and
+    their pages must only be drawn while holding the returned lock; the lock
+    is None for parts that are not shared.
+    Images are downsampled to dpi unless dpi is None.
+    """
+    key = _cache_key(html_content, css_text, start_page, dpi) if static else None
+    if key:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+
+    if dpi is not None:
+        with profile_phase('image_downsampling'):
+            html_content = downsample_images(html_content, dpi)
+
+    stylesheets = []
+    if css_text:
+        stylesheets.append(CSS(string=css_text, base_url=css_base_url))
+    if start_page != 1:
+        # A page counter reset replaces the implicit increment on that page
+        stylesheets.append(CSS(string=f"@page :first {{ counter-reset: page {start_page}; }}"))
+
+    with profile_phase('render'):
+        document = HTML(string=html_content).render(stylesheets=stylesheets)
+
+    if not key:
+        return document, None
+
+    entry = (document, threading.Lock())
+    with _cache_lock:
+        _cache[key] = entry
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return entry
+
+
+def compose_pdf(parts: List[Tuple[str, bool]], output_path: str, css_text: Optional[str] = None,
+                css_base_url: Optional[str] = None, dpi: Optional[int] = 150) -> int:
+    """
+    Render (html_content, static) parts in order and write them as one PDF.
+
+    Returns the total number of pages written.
+    """
+    documents = []
+    locks = {}
+    start_page = 1
+    for html_content, static in parts:
+        document, lock = render_part(html_content, css_text, css_base_url, start_page, static, dpi)
+        documents.append(document)
+        if lock is not None:
+            locks[id(lock)] = lock
+        start_page += len(document.pages)
+
+    pages = [page for document in documents for page in document.pages]
+    with ExitStack() as stack:
+        # Take the locks of shared parts in a fixed order to avoid deadlocks
+        for lock_id in sorted(locks):
+            stack.enter_context(locks[lock_id])
+        with profile_phase('drawing'):
+            documents[0].copy(pages).write_pdf(output_path)
+    return len(pages)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Document Converter Compression - Compressed request bodies and responses
+
+Streams gzip/zstd request bodies through a decompressor with a cap on the
+decompressed size, and compresses compressible responses (PDF, JSON, text)
+according to the client's Accept-Encoding. Already-compressed outputs such
+as PNG, JPEG and ZIP are passed through untouched.
+"""
+
+import zlib
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Media types worth compressing on the wire
+COMPRESSIBLE_TYPES = ('application/pdf', 'application/json', 'text/')
+
+# zstd cannot bound the output of a single decompress() call. A zstd block
+# decodes to at most 128 KiB and takes at least 4 bytes, so each input byte
+# yields at most 32 KiB; slicing the input by that ratio keeps every step
+# within the remaining size budget plus one block.
+ZSTD_MAX_RATIO = 32 * 1024
+
+
+def available_encodings() -> list:
+    """Return the content codings supported here, in order of preference."""
+    return (['zstd'] if zstandard else []) + ['gzip']
+
+
+class _StreamDecoder:
+    """Decode a body made of one or more concatenated compressed members."""
+
+    encoding = None
+
+    def __init__(self):
+        self._decompressor = self._new_decompressor()
+
+    def decode(self, data: bytes, limit: int):
+        """Yield decompressed chunks, each at most about limit bytes past the budget."""
+        data = memoryview(data)
+        while data:
+            if self._decompressor.eof:
+                # Concatenated members decode to the concatenation of their contents
+                self._decompressor = self._new_decompressor()
+            chunk, data = self._step(data, max(limit, 0))
+            limit -= len(chunk)
+            yield chunk
+
+    def finish(self):
+        """Reject bodies that end part-way through a member."""
+        if not self._decompressor.eof:
+            raise HTTPException(status_code=400, detail=f"Truncated {self.encoding} request body")
+
+    def _leftover(self, rest) -> memoryview:
+        # Input after the end of a member starts the next one
+        if self._decompressor.eof:
+            return memoryview(bytes(self._decompressor.unused_data) + bytes(rest))
+        return memoryview(rest)
+
+
+class _GzipDecoder(_StreamDecoder):
+    encoding = 'gzip'
+
+    def _new_decompressor(self):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _step(self, data, limit: int):
+        chunk = self._decompressor.decompress(data, limit + 1)
+        return chunk, self._leftover(self._decompressor.unconsumed_tail)
+
+
+class _ZstdDecoder(_StreamDecoder):
+    encoding = 'zstd'
+
+    def _new_decompressor(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    def _step(self, data, limit: int):
+        size = max(1, limit // ZSTD_MAX_RATIO)
+        chunk = self._decompressor.decompress(data[:size])
+        return chunk, self._leftover(data[size:])
+
+
+def _decoder_for(content_encoding: str):
+    encoding = content_encoding.strip().lower()
+    if encoding in ('', 'identity'):
+        return None
+    if encoding in ('gzip', 'x-gzip'):
+        return _GzipDecoder()
+    if encoding == 'zstd' and zstandard:
+        return _ZstdDecoder()
+    raise HTTPException(
+        status_code=415,
+        detail=f"Unsupported Content-Encoding: {content_encoding}. Supported: {', '.join(available_encodings())}"
+    )
+
+
+async def read_body(request: Request, max_size: int) -> bytes:
+    """Read the request body, decompressing it as it streams in.
+
+    Raises a 413 as soon as the (decompressed) body grows past max_size.
+    """
+    decoder = _decoder_for(request.headers.get('content-encoding', ''))
+    parts = []
+    size = 0
+
+    def add(chunk: bytes):
+        nonlocal size
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(status_code=413, detail=f"Request body exceeds {max_size} bytes")
+        parts.append(chunk)
+
+    try:
+        async for data in request.stream():
+            if decoder is None:
+                add(data)
+                continue
+            for chunk in decoder.decode(data, max_size - size):
+                add(chunk)
+        if decoder is not None:
+            decoder.finish()
+    except (zlib.error, getattr(zstandard, 'ZstdError', zlib.error)) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid compressed request body: {str(e)}")
+    return b''.join(parts)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the preferred supported coding from an Accept-Encoding header."""
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding.strip().lower()] = quality
+
+    best = None
+    for coding in available_encodings():
+        quality = weights.get(coding, weights.get('*', 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (coding, quality)
+    return best[0] if best else None
+
+
+def _compressor_for(encoding: str, level: int):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing compressible responses with gzip or zstd."""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, zstd_level: int = 3):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {'gzip': gzip_level, 'zstd': zstd_level}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                media_type = headers.get('content-type', '').split(';')[0].strip().lower()
+                if 'content-encoding' in headers or not media_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Hold the start message until we know the body size
+                    start_message = message
+                return
+
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                headers = MutableHeaders(raw=start_message['headers'])
+                headers['Content-Encoding'] = encoding
+                headers.add_vary_header('Accept-Encoding')
+                if 'content-length' in headers:
+                    del headers['content-length']
+                # The encoded bytes differ from the file's, so a strong
+                # validator must not be shared between the two
+                etag = headers.get('etag')
+                if etag and not etag.startswith('W/'):
+                    headers['ETag'] = f"W/{etag}"
+                compressor = _compressor_for(encoding, self.levels[encoding])
+                await send(start_message)
+
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.flush()
+            if data or not more_body:
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -9,6 +9,13 @@ import sys
 from pathlib import Path
 import markdown2
 from weasyprint import HTML, CSS
+from profiling import ConversionProfiler, current_profiler, profile_phase
+from images import downsample_images
+from compose import compose_pdf
+
+
+# Resolution embedded images are downsampled to unless --print-quality is given
+DOWNSAMPLE_DPI = 150
 
 
 def read_file(file_path):
@@ -23,19 +30,20 @@ def read_file(file_path):
 
 def markdown_to_html(markdown_content):
     """Convert Markdown content to HTML."""
-    html = markdown2.markdown(
-        markdown_content,
-        extras=[
-            'fenced-code-blocks',
-            'tables',
-            'break-on-newline',
-            'header-ids',
-            'code-friendly',
-            'footnotes',
-            'strike',
-            'task_list'
-        ]
-    )
+    with profile_phase('markdown_to_html'):
+        html = markdown2.markdown(
+            markdown_content,
+            extras=[
+                'fenced-code-blocks',
+                'tables',
+                'break-on-newline',
+                'header-ids',
+                'code-friendly',
+                'footnotes',
+                'strike',
+                'task_list'
+            ]
+        )
     return html
 
 
@@ -54,9 +62,16 @@ def wrap_html_with_template(body_html):
 </html>"""
 
 
-def convert_to_pdf(html_content, output_path, css_path=None):
+def convert_to_pdf(html_content, output_path, css_path=None, print_quality=False):
     """Convert HTML content to PDF with Google Docs styling."""
     try:
+        # Shrink oversized images to their rendered size before layout. The
+        # bound assumes style.css's letter page, so custom CSS skips this step.
+        custom_css = css_path and os.path.exists(css_path)
+        if not print_quality and not custom_css:
+            with profile_phase('image_downsampling'):
+                html_content = downsample_images(html_content, DOWNSAMPLE_DPI)
+        
         # Determine which CSS file to use
         css_files = []
         if css_path and os.path.exists(css_path):
@@ -67,13 +82,12 @@ def convert_to_pdf(html_content, output_path, css_path=None):
             if os.path.exists(default_css):
                 css_files.append(default_css)
         
-        # Create PDF with CSS
-        html_obj = HTML(string=html_content)
-        if css_files:
-            stylesheets = [CSS(filename=css_file) for css_file in css_files]
-            html_obj.write_pdf(output_path, stylesheets=stylesheets)
-        else:
-            html_obj.write_pdf(output_path)
+        # Create PDF with CSS (render runs the CSS cascade and layout, write_pdf draws)
+        stylesheets = [CSS(filename=css_file) for css_file in css_files]
+        with profile_phase('render'):
+            document = HTML(string=html_content).render(stylesheets=stylesheets)
+        with profile_phase('drawing'):
+            document.write_pdf(output_path)
         
         print(f"✓ PDF created successfully: {output_path}")
         return True
@@ -84,66 +98,125 @@ def convert_to_pdf(html_content, output_path, css_path=None):
         return False
 
 
+def compose_to_pdf(html_documents, output_path, css_path=None, print_quality=False):
+    """Compose several HTML documents into one PDF with continuous page numbers."""
+    try:
+        # Determine which CSS file to use
+        custom_css = css_path and os.path.exists(css_path)
+        if not custom_css:
+            css_path = os.path.join(os.path.dirname(__file__), 'style.css')
+        css_text = None
+        if os.path.exists(css_path):
+            css_text = read_file(css_path)
+        
+        # Render each document separately and join the pages
+        parts = [(html_content, False) for html_content in html_documents]
+        # Image downsampling assumes style.css's letter page
+        dpi = DOWNSAMPLE_DPI if not (print_quality or custom_css) else None
+        page_count = compose_pdf(parts, output_path, css_text, css_path, dpi)
+        
+        print(f"✓ PDF created successfully: {output_path} ({page_count} pages)")
+        return True
+    except Exception as e:
+        print(f"Error composing PDF: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Convert HTML or Markdown files to Google Docs-styled PDFs'
     )
     parser.add_argument(
-        'input_file',
-        help='Input file (HTML or Markdown)'
+        'input_files',
+        nargs='+',
+        metavar='input_file',
+        help='Input file (HTML or Markdown); several files are composed into one PDF in order'
     )
     parser.add_argument(
         '-o', '--output',
-        help='Output PDF file path (default: same name as input with .pdf extension)'
+        help='Output PDF file path (default: same name as the first input with .pdf extension)'
     )
     parser.add_argument(
         '-c', '--css',
         help='Custom CSS file for styling (optional)'
     )
+    parser.add_argument(
+        '--print-quality',
+        action='store_true',
+        help='Keep embedded images at full resolution instead of downsampling them'
+    )
+    parser.add_argument(
+        '--profile-out',
+        help='Profile the conversion and write PATH.folded (flame graph stacks) and PATH.json (per-stage summary)',
+        metavar='PATH'
+    )
     
     args = parser.parse_args()
     
-    # Validate input file
-    if not os.path.exists(args.input_file):
-        print(f"Error: Input file '{args.input_file}' not found")
-        sys.exit(1)
+    # Validate input files
+    for input_file in args.input_files:
+        if not os.path.exists(input_file):
+            print(f"Error: Input file '{input_file}' not found")
+            sys.exit(1)
     
     # Determine output file path
     if args.output:
         output_path = args.output
     else:
-        input_path = Path(args.input_file)
+        input_path = Path(args.input_files[0])
         output_path = input_path.with_suffix('.pdf')
     
-    # Read input file
-    print(f"Reading {args.input_file}...")
-    content = read_file(args.input_file)
+    # Start profiling before any conversion work so every stage is sampled
+    profiler = None
+    if args.profile_out:
+        profiler = ConversionProfiler(label=', '.join(args.input_files)).start()
+        profiler.attach()
+        current_profiler.set(profiler)
     
-    # Determine file type and convert to HTML
-    file_ext = Path(args.input_file).suffix.lower()
-    
-    if file_ext in ['.md', '.markdown']:
-        print("Converting Markdown to HTML...")
-        html_body = markdown_to_html(content)
-        html_content = wrap_html_with_template(html_body)
-    elif file_ext in ['.html', '.htm']:
-        print("Processing HTML...")
-        # Check if it's a complete HTML document or just a fragment
-        if '<html' in content.lower():
-            html_content = content
+    html_documents = []
+    for input_file in args.input_files:
+        # Read input file
+        print(f"Reading {input_file}...")
+        content = read_file(input_file)
+        
+        # Determine file type and convert to HTML
+        file_ext = Path(input_file).suffix.lower()
+        
+        if file_ext in ['.md', '.markdown']:
+            print("Converting Markdown to HTML...")
+            html_body = markdown_to_html(content)
+            html_content = wrap_html_with_template(html_body)
+        elif file_ext in ['.html', '.htm']:
+            print("Processing HTML...")
+            # Check if it's a complete HTML document or just a fragment
+            if '<html' in content.lower():
+                html_content = content
+            else:
+                html_content = wrap_html_with_template(content)
         else:
-            html_content = wrap_html_with_template(content)
-    else:
-        print(f"Error: Unsupported file type '{file_ext}'. Supported: .md, .markdown, .html, .htm")
-        sys.exit(1)
+            print(f"Error: Unsupported file type '{file_ext}'. Supported: .md, .markdown, .html, .htm")
+            sys.exit(1)
+        html_documents.append(html_content)
     
     # Convert to PDF
     print("Generating PDF...")
-    success = convert_to_pdf(html_content, output_path, args.css)
+    if len(html_documents) == 1:
+        success = convert_to_pdf(html_documents[0], output_path, args.css, args.print_quality)
+    else:
+        success = compose_to_pdf(html_documents, output_path, args.css, args.print_quality)
+    
+    if profiler:
+        profiler.stop()
+        folded_path = profiler.save(args.profile_out)
+        print(f"✓ Profile written: {folded_path}")
+        for stage, stats in profiler.summary()['stages'].items():
+            print(f"  {stage:<18} {stats['percent']:5.1f}%")
     
     if success:
         print(f"\n✓ Conversion complete!")
-        print(f"  Input:  {args.input_file}")
+        print(f"  Input:  {', '.join(args.input_files)}")
         print(f"  Output: {output_path}")
     else:
         sys.exit(1)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Document Converter Images - Downsample oversized raster images before layout
+
+WeasyPrint decodes every <img> at full resolution and embeds it full-size in
+the PDF. This stage decodes embedded (data: URI) and linked raster images
+once, shrinks them to the largest size they can be rendered at for the target
+DPI, and rewrites the references to point at the resized copy.
+"""
+
+import base64
+import hashlib
+import io
+import re
+import threading
+from collections import OrderedDict
+from html import unescape
+from typing import Optional, Tuple
+from urllib.parse import unquote_to_bytes
+
+from PIL import Image, ImageOps
+from weasyprint import default_url_fetcher
+
+
+# Content box of the default letter page with 0.75in margins (see style.css).
+# Callers skip downsampling when custom CSS may change the page size.
+MAX_WIDTH_IN = 7.0
+MAX_HEIGHT_IN = 9.5
+
+# Formats worth resizing; animated and vector images are left alone
+RESIZABLE_FORMATS = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+# Number of resized images kept in memory, keyed by source hash and size
+CACHE_SIZE = 64
+
+IMG_TAG_RE = re.compile(r'<img\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*>', re.IGNORECASE)
+# One attribute (or a stray "/"), matched in turn from the end of the last one
+ATTR_RE = re.compile(r'\s*(?:([^\s"\'>/=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+)))?|/)')
+LINKED_SCHEMES = ('http://', 'https://', 'file://')
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _read_source(src: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """Return the raw bytes behind an image src and, for linked images, their MIME type."""
+    if src[:5].lower() == 'data:':
+        header, _, data = src[5:].partition(',')
+        if not header.lower().startswith('image/') or header.lower().startswith('image/svg'):
+            return None, None
+        if header.lower().endswith(';base64'):
+            return base64.b64decode(data), None
+        return unquote_to_bytes(data), None
+    if src.lower().startswith(LINKED_SCHEMES):
+        result = default_url_fetcher(src)
+        mime_type = result.get('mime_type') or 'application/octet-stream'
+        if 'string' in result:
+            return result['string'], mime_type
+        with result['file_obj'] as file_obj:
+            return file_obj.read(), mime_type
+    return None, None
+
+
+def _data_uri(data: bytes, mime_type: str) -> str:
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def _resize(data: bytes, max_size: Tuple[int, int]) -> Optional[str]:
+    """Shrink an image to fit max_size; return a data URI or None to keep it."""
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Image.UnidentifiedImageError:
+        # Not a raster format Pillow knows (e.g. a linked SVG)
+        return None
+
+    with img:
+        mime_type = RESIZABLE_FORMATS.get(img.format)
+        if mime_type is None or getattr(img, 'n_frames', 1) > 1:
+            return None
+
+        # Bounds apply to the displayed orientation, so swap them for
+        # images that EXIF rotates by 90 degrees
+        max_width, max_height = max_size
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):
+            max_width, max_height = max_height, max_width
+        if img.width <= max_width and img.height <= max_height:
+            return None
+
+        image_format = img.format
+        img.thumbnail((max_width, max_height), Image.LANCZOS)
+        # The resized copy drops EXIF, so bake the orientation into the pixels
+        resized = ImageOps.exif_transpose(img)
+
+        output = io.BytesIO()
+        if image_format == 'JPEG':
+            if resized.mode not in ('RGB', 'L', 'CMYK'):
+                resized = resized.convert('RGB')
+            resized.save(output, 'JPEG', quality=90, optimize=True)
+        else:
+            resized.save(output, image_format, optimize=True)
+
+    if output.tell() >= len(data):
+        return None
+    return _data_uri(output.getvalue(), mime_type)
+
+
+def _resized(data: bytes, max_size: Tuple[int, int]) -> Optional[str]:
+    """Return the cached or freshly resized data URI for image bytes."""
+    key = (hashlib.sha256(data).hexdigest(), max_size)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    try:
+        resized = _resize(data, max_size)
+    except Exception as e:
+        print(f"Could not downsample image: {e}")
+        resized = None
+
+    with _cache_lock:
+        _cache[key] = resized
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return resized
+
+
+def _is_raster_type(mime_type: Optional[str]) -> bool:
+    # Inlining SVG would break its relative references, and anything that
+    # is not an image (e.g. an HTML error page) is left for WeasyPrint to reject
+    return bool(mime_type) and mime_type.startswith('image/') and not mime_type.startswith('image/svg')
+
+
+def _replacement_src(src: str, max_size: Tuple[int, int]) -> Optional[str]:
+    """Return the src to use instead of src, or None to leave it unchanged.
+
+    Linked raster images are always inlined, resized or not, so WeasyPrint
+    does not download them a second time.
+    """
+    try:
+        data, linked_mime_type = _read_source(src)
+    except Exception as e:
+        print(f"Could not load image for downsampling: {e}")
+        return None
+    if not data:
+        return None
+
+    resized = _resized(data, max_size)
+    if resized is None and _is_raster_type(linked_mime_type):
+        return _data_uri(data, linked_mime_type)
+    return resized
+
+
+def _find_src(tag: str) -> Optional[Tuple[str, int, int]]:
+    """Return the src value of an <img> tag and the span of the attribute."""
+    position = len('<img')
+    while True:
+        attr = ATTR_RE.match(tag, position)
+        if attr is None or attr.end() == position:
+            return None
+        # The first src wins, as in HTML parsing
+        if attr.group(1) and attr.group(1).lower() == 'src':
+            value = next((group for group in attr.groups()[1:] if group is not None), '')
+            return value, attr.start(1), attr.end()
+        position = attr.end()
+
+
+def downsample_images(html_content: str, dpi: int = 150) -> str:
+    """
+    Downsample oversized raster images in HTML to the page content box at dpi.
+
+    The repo renders without presentational hints, so width/height attributes
+    do not size images; style.css caps them at the content width instead.
+    """
+    page_size = (round(MAX_WIDTH_IN * dpi), round(MAX_HEIGHT_IN * dpi))
+
+    def rewrite(match):
+        tag = match.group(0)
+        found = _find_src(tag)
+        if found is None:
+            return tag
+
+        src, start, end = found
+        replacement = _replacement_src(unescape(src).strip(), page_size)
+        if replacement is None:
+            return tag
+        return f'{tag[:start]}src="{replacement}"{tag[end:]}'
+
+    return IMG_TAG_RE.sub(rewrite, html_content)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Document Converter Profiling - Sampling profiler for individual conversions
+
+Samples the converting thread's Python stack at a fixed interval and writes
+the result in the "folded stacks" format understood by flamegraph.pl,
+speedscope and inferno, plus a JSON summary that splits the time across the
+conversion stages (Markdown, CSS cascade, layout, drawing, rasterization).
+"""
+
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+
+# Stage a sample is attributed to, chosen by the outermost frame whose file
+# path contains one of these fragments (so text shaping called from drawing
+# counts as drawing). Samples outside any of them fall back to the phase that
+# was active when they were taken.
+STAGE_PATTERNS = [
+    ('markdown_to_html', ('markdown2',)),
+    ('css_cascade', ('weasyprint/css', 'tinycss2', 'cssselect2')),
+    ('layout', ('weasyprint/layout', 'weasyprint/text', 'weasyprint/formatting_structure')),
+    ('drawing', ('weasyprint/draw', 'weasyprint/pdf', 'weasyprint/stacking', 'pydyf')),
+    ('rasterization', ('pdf2image',)),
+]
+
+# Profiler attached to the conversion currently running in this context
+current_profiler: ContextVar[Optional['ConversionProfiler']] = ContextVar('current_profiler', default=None)
+
+
+class ConversionProfiler:
+    """Sample the stack of the thread running a conversion."""
+
+    def __init__(self, label: str = 'conversion', interval: float = 0.005):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.interval = interval
+        self.phases = {}
+        self.stacks = Counter()
+        self.stages = Counter()
+        self.started_at = None
+        self.duration = 0.0
+        self._phase = None
+        self._thread_id = None
+        self._stop_event = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        """Start the sampler; only an attached thread is sampled."""
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name='conversion-profiler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def attach(self):
+        """Sample the calling thread until detach() is called."""
+        self._thread_id = threading.get_ident()
+
+    def detach(self):
+        """Stop sampling the attached thread."""
+        self._thread_id = None
+
+    @contextmanager
+    def sampling(self):
+        """Sample the calling thread while the block runs."""
+        self.attach()
+        try:
+            yield
+        finally:
+            self.detach()
+
+    def stop(self):
+        """Stop sampling and record the total duration."""
+        self.detach()
+        self._stop_event.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        self.duration = time.perf_counter() - self._start
+        return self
+
+    @contextmanager
+    def phase(self, name: str):
+        """Record the wall-clock time spent in a named conversion phase."""
+        previous = self._phase
+        self._phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+            self._phase = previous
+
+    def render_time(self) -> float:
+        """Return the seconds spent in conversion phases, excluding any waiting."""
+        return sum(self.phases.values())
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            thread_id = self._thread_id
+            if thread_id is None:
+                continue
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            self._record(frame, self._phase)
+
+    def _record(self, frame, phase: Optional[str]):
+        frames = []
+        stage = None
+        while frame is not None:
+            code = frame.f_code
+            filename = code.co_filename.replace(os.sep, '/')
+            stage = _classify(filename) or stage
+            frames.append(f"{code.co_name} ({os.path.basename(filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stage = stage or phase or 'other'
+        frames.append(stage)
+        # Folded format is root-first, semicolon separated
+        self.stacks[';'.join(reversed(frames))] += 1
+        self.stages[stage] += 1
+
+    def folded(self) -> str:
+        """Return the samples in folded-stack format."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> dict:
+        """Return a JSON-serialisable summary of the profile."""
+        total = sum(self.stages.values())
+        return {
+            'id': self.id,
+            'label': self.label,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 2),
+            'render_ms': round(self.render_time() * 1000, 2),
+            'interval_ms': self.interval * 1000,
+            'samples': total,
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+            'stages': {
+                name: {'samples': count, 'percent': round(100.0 * count / total, 1)}
+                for name, count in self.stages.most_common()
+            },
+        }
+
+    def save(self, base_path: str) -> str:
+        """Write <base_path>.folded and <base_path>.json; return the folded path."""
+        directory = os.path.dirname(base_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{base_path}.folded", 'w', encoding='utf-8') as f:
+            f.write(self.folded())
+        with open(f"{base_path}.json", 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        return f"{base_path}.folded"
+
+
+def _classify(filename: str) -> Optional[str]:
+    for stage, fragments in STAGE_PATTERNS:
+        if any(fragment in filename for fragment in fragments):
+            return stage
+    return None
+
+
+def prune_profiles(directory: str, max_count: int):
+    """Delete the oldest saved profiles so at most max_count remain."""
+    if not os.path.isdir(directory):
+        return
+    summaries = [
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.json')
+    ]
+    summaries.sort(key=os.path.getmtime, reverse=True)
+    for summary in summaries[max_count:]:
+        base_path = summary[:-len('.json')]
+        for path in (f"{base_path}.json", f"{base_path}.folded"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def token_matches(token: str, admin_token: Optional[str]) -> bool:
+    """Compare a request's admin token with the configured one in constant time."""
+    return bool(admin_token) and hmac.compare_digest(token.encode(), admin_token.encode())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling /convert/* requests on admin demand or when sampled as slow."""
+
+    def __init__(self, app, admin_token: Optional[str], directory: str, slow_ms: float = 0,
+                 sample_rate: float = 0.05, max_count: int = 100):
+        self.app = app
+        self.admin_token = admin_token
+        self.directory = directory
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.max_count = max_count
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith('/convert/'):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        requested = headers.get('x-profile', '').lower() in ('1', 'true', 'yes')
+        if requested and not token_matches(headers.get('x-admin-token', ''), self.admin_token):
+            response = JSONResponse(status_code=403, content={"detail": "Profiling requires a valid X-Admin-Token"})
+            await response(scope, receive, send)
+            return
+        # Profiles are only readable by an admin, so none are captured without a token
+        sampled = (not requested and bool(self.admin_token) and self.slow_ms > 0
+                   and random.random() < self.sample_rate)
+        if not (requested or sampled):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = ConversionProfiler(label=scope['path']).start()
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            profiler.stop()
+            # Judge slowness by time spent rendering, not upload or queueing time
+            if requested or profiler.render_time() * 1000 >= self.slow_ms:
+                profiler.save(os.path.join(self.directory, profiler.id))
+                prune_profiles(self.directory, self.max_count)
+
+        async def send_with_profile(message):
+            if message['type'] == 'http.response.start':
+                # The conversion is done once the response starts, so save the
+                # profile before the client can ask for it
+                finish()
+                if requested:
+                    MutableHeaders(scope=message).append('X-Profile-Id', profiler.id)
+            await send(message)
+
+        token = current_profiler.set(profiler)
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            current_profiler.reset(token)
+            finish()
+
+
+def profiled_call(func, *args):
+    """Call func, sampling the calling thread if a profiler is active."""
+    profiler = current_profiler.get()
+    if profiler is None:
+        return func(*args)
+    with profiler.sampling():
+        return func(*args)
+
+
+def profile_phase(name: str):
+    """Time a phase on the active profiler, or do nothing if none is active."""
+    profiler = current_profiler.get()
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name)